@@ -1,119 +1,494 @@
 import os
+import asyncio
+import csv
+import functools
+import hashlib
+import itertools
+import aiohttp
 import requests
 import json
-import pandas as pd
-from plexapi.server import PlexServer
-from plexapi.exceptions import NotFound, BadRequest
+import orjson
+import re
+import threading
 import time
 import configparser
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
 from datetime import datetime
-from requests.exceptions import RequestException, Timeout
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+from typing import Optional
+from urllib3.util.retry import Retry
 
 # import logging
 # logging.basicConfig(level=logging.DEBUG)
 
+MAX_RETRIES = 3
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+# Shared HTTP session so repeated API calls reuse keep-alive connections
+SESSION = requests.Session()
+adapter = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(
+        total=MAX_RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=RETRY_STATUSES,
+        # The default allowed_methods only retries idempotent verbs; POSTs here upload files, create
+        # batches and exchange single-use refresh tokens, so a retry could repeat them
+        raise_on_status=False
+    )
+)
+SESSION.mount("https://", adapter)
+SESSION.mount("http://", adapter)
+
+# The system message and response format are identical for every request so OpenAI's
+# prompt cache can reuse the shared prefix across calls
+SYSTEM_MESSAGE = "You are a recommendation system for movies and TV shows."
+
+RESPONSE_FORMAT_INSTRUCTIONS = """For each recommendation, provide the following in JSON format:
+
+{
+  "title": "Title",
+  "genre": "Genre(s)",
+  "description": "A brief description",
+  "reason": "A brief explanation of why this is recommended"
+}
+
+Please provide the entire response as a JSON object of the form {"recommendations": [...]}, where the array holds the recommendation objects.
+"""
+
+SYSTEM_PROMPT_MESSAGE = {"role": "system", "content": SYSTEM_MESSAGE}
+
+STANDARD_TASK_TEMPLATE = (
+    "Task: based on my watch history and ratings, recommend {count} new {media_type_lower}s that I might like, "
+    "and explain each reason in terms of what I have watched and rated."
+)
+
+# Braces in the format instructions are escaped so the template can go through str.format
+COLLECTION_PROMPT_TEMPLATE = RESPONSE_FORMAT_INSTRUCTIONS.replace('{', '{{').replace('}', '}}') + "\nTask: {criteria}"
+
+# Additional collections for Movies: (collection name, criteria, cache TTL in hours).
+# {season} and {holiday} are filled in at run time; evergreen lists can be cached much longer
+ADDITIONAL_COLLECTIONS = [
+    ("Seasonal", "Recommend 10 movies suitable for {season} season.", 24),
+    ("Holiday", "Recommend 10 movies suitable for {holiday}.", 24),
+    ("Romantic Comedy", "Recommend 10 top romantic comedy movies.", 24),
+    ("Action Adventure", "Recommend 10 exciting action-adventure movies.", 24),
+    ("Family Friendly", "Recommend 10 family-friendly movies suitable for all ages.", 24),
+    ("Sci-Fi Spectacle", "Recommend 10 mind-bending science fiction movies.", 24),
+    ("Classic Cinema", "Recommend 10 classic movies from various decades that have stood the test of time.", 720),
+    ("Based on True Story", "Recommend 10 compelling movies based on true stories or real events.", 24),
+    ("90s & 00s Teenage Movies", "Recommend 10 iconic teenage movies from the 1990s and 2000s.", 720),
+    ("Very Sarcastic Movies", "Recommend 10 highly sarcastic or satirical movies, similar in tone to 'Baby Mama (2008)' or 'They Came Together (2014)'.", 24)
+]
+
+# Request settings shared by every recommendation call
+REQUEST_TEMPLATE = {
+    'model': 'gpt-4o-mini',
+    'temperature': 0.7,
+    'n': 1,
+    'response_format': {'type': 'json_object'},
+}
+
+CACHE_DIR = '/output/.cache'
+STATE_FILE = '/output/.state.json'
+OPENAI_API_URL = 'https://api.openai.com/v1'
+SEMANTIC_CACHE_DIR = '/output/.semcache'
+SEMANTIC_CACHE_THRESHOLD = 0.95
+# Each recommendation takes about 90-100 output tokens, plus a little for the surrounding JSON object
+TOKENS_PER_RECOMMENDATION = 120
+RESPONSE_TOKEN_HEADROOM = 200
+
+@functools.lru_cache(maxsize=1)
 def read_config(config_file=None):
-    """Read configuration from the specified file or environment variable."""
+    """Read configuration from the specified file or environment variable, parsing it only once per run."""
     if config_file is None:
         config_file = os.environ.get('CONFIG_FILE', 'plex_recommendations.ini')
     config = configparser.ConfigParser()
     config.read(config_file)
     return config, config_file
 
-def check_ombi_credentials(config):
-    """Check if Ombi credentials are set in the config."""
-    try:
-        ombi_url = config.get('OMBI', 'OMBI_URL')
-        ombi_api_key = config.get('OMBI', 'OMBI_API_KEY')
-        return bool(ombi_url and ombi_api_key)
-    except (configparser.NoSectionError, configparser.NoOptionError):
-        return False
+@dataclass(frozen=True)
+class Settings:
+    """Configuration values resolved once at startup."""
+    plex_url: Optional[str]
+    plex_token: Optional[str]
+    gpt_api_key: Optional[str]
+    number_of_recommendations: int = 10
+    max_prompt_titles: int = 200
+    use_batch_api: bool = False
+    skip_unchanged_days: float = 7
+    ombi_url: Optional[str] = None
+    ombi_api_key: Optional[str] = None
+    trakt_client_id: Optional[str] = None
+    trakt_access_token: Optional[str] = None
+
+    @property
+    def ombi_enabled(self):
+        return bool(self.ombi_url and self.ombi_api_key)
+
+    @property
+    def trakt_enabled(self):
+        return bool(self.trakt_access_token)
+
+def load_settings(config):
+    """Build Settings from the parsed config. Trakt tokens are filled in after authentication."""
+    return Settings(
+        plex_url=config.get('PLEX', 'PLEX_URL', fallback=None),
+        plex_token=config.get('PLEX', 'PLEX_TOKEN', fallback=None),
+        gpt_api_key=config.get('GPT', 'GPT4O_API_KEY', fallback=None),
+        number_of_recommendations=config.getint('RECOMMENDATIONS', 'NUMBER_OF_RECOMMENDATIONS', fallback=10),
+        max_prompt_titles=config.getint('RECOMMENDATIONS', 'MAX_PROMPT_TITLES', fallback=200),
+        use_batch_api=config.getboolean('RECOMMENDATIONS', 'USE_BATCH_API', fallback=False),
+        skip_unchanged_days=config.getfloat('RECOMMENDATIONS', 'SKIP_UNCHANGED_DAYS', fallback=7),
+        ombi_url=config.get('OMBI', 'OMBI_URL', fallback=None),
+        ombi_api_key=config.get('OMBI', 'OMBI_API_KEY', fallback=None),
+        trakt_client_id=config.get('TRAKT', 'CLIENT_ID', fallback=None)
+    )
 
-def get_watched_titles(plex):
-    """Retrieve watched movies and TV shows from Plex."""
-    print("Retrieving watched movies and TV shows from Plex...")
-    watched_titles = []
+def build_title_index(items):
+    """Map lowercase titles to their Plex items, keeping the first item for duplicate titles."""
+    index = {}
+    for item in items:
+        index.setdefault(item.title.lower(), item)
+    return index
 
-    movies = plex.library.section('Movies').all()
-    watched_titles.extend([movie.title for movie in movies if movie.isPlayed])
+def scan_library(movies, tv_shows):
+    """Collect watched titles (most recently watched first) and user ratings in one pass over the library."""
+    print("Retrieving watched titles and user ratings from Plex...")
 
-    tv_shows = plex.library.section('TV Shows').all()
-    for show in tv_shows:
-        if show.isWatched or any(episode.isPlayed for episode in show.episodes()):
-            watched_titles.append(show.title)
+    last_viewed = {}
+    ratings = {}
 
-    watched_titles = list(set(watched_titles))
+    for item in itertools.chain(movies, tv_shows):
+        if item.type == 'show':
+            # viewedLeafCount comes with the library listing, so no per-show episode requests are needed
+            watched = item.isWatched or (getattr(item, 'viewedLeafCount', 0) or 0) > 0
+        else:
+            watched = item.isPlayed
+
+        # Deduplicate while scanning, keeping the latest view per title
+        if watched:
+            timestamp = item.lastViewedAt.timestamp() if item.lastViewedAt else 0
+            if timestamp >= last_viewed.get(item.title, -1):
+                last_viewed[item.title] = timestamp
+
+        if getattr(item, 'userRating', None) is not None:
+            ratings[item.title] = item.userRating
+
+    watched_titles = sorted(last_viewed, key=last_viewed.get, reverse=True)
     print(f"Total watched titles retrieved: {len(watched_titles)}")
-    return watched_titles
+    print(f"Found {len(ratings)} rated titles.")
+    return watched_titles, ratings
 
-def get_user_preferences(plex):
-    """Retrieve user's ratings for movies and TV shows from Plex."""
-    ratings = {}
+def _cache_key(data):
+    """Build a content-addressed cache key from the API request body."""
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
 
-    print("Retrieving user ratings from Plex...")
+def load_cached_response(key, ttl_hours):
+    """Return the cached API response for the key if it is younger than the TTL."""
+    cache_file = os.path.join(CACHE_DIR, f"{key}.json")
+    try:
+        if time.time() - os.path.getmtime(cache_file) > ttl_hours * 3600:
+            return None
+        with open(cache_file, 'rb') as f:
+            return orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return None
 
-    # Get ratings from Movies
-    for movie in plex.library.section('Movies').all():
-        if hasattr(movie, 'userRating') and movie.userRating is not None:
-            ratings[movie.title] = movie.userRating
+def save_cached_response(key, response_data):
+    """Atomically write an API response to the on-disk cache."""
+    cache_file = os.path.join(CACHE_DIR, f"{key}.json")
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_file = f"{cache_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(response_data, f)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print(f"Could not write recommendation cache: {e}")
+
+def _prompt_tokens(prompt):
+    """Split a prompt into its set of lowercase word tokens."""
+    return set(re.findall(r"\w+", prompt.lower()))
+
+def _semantic_cache_file(media_type, collection_name, scope, max_tokens):
+    """Return the near-duplicate cache file for a partition.
+
+    The scope is the prompt text outside the watch history (task and count), so prompts are only
+    compared with earlier ones that ask for exactly the same thing.
+    """
+    partition = hashlib.sha256(f"{media_type}:{collection_name}:{max_tokens}:{scope}".encode()).hexdigest()
+    return os.path.join(SEMANTIC_CACHE_DIR, f"{partition}.json")
+
+def load_similar_response(prompt, media_type, collection_name, scope, max_tokens, ttl_hours):
+    """Return the cached response of a near-identical earlier prompt for the same partition."""
+    cache_file = _semantic_cache_file(media_type, collection_name, scope, max_tokens)
+    try:
+        with open(cache_file, 'rb') as f:
+            entry = orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return None
 
-    # Get ratings from TV Shows
-    tv_shows = plex.library.section('TV Shows').all()  # This line was missing, so now it's added
-    for show in tv_shows:
-        if hasattr(show, 'userRating') and show.userRating is not None:
-            ratings[show.title] = show.userRating
+    if time.time() - entry.get('timestamp', 0) > ttl_hours * 3600:
+        return None
 
-    print(f"Found {len(ratings)} rated titles.")
-    return ratings
+    tokens = _prompt_tokens(prompt)
+    cached_tokens = set(entry.get('tokens', []))
+    union = tokens | cached_tokens
+    similarity = len(tokens & cached_tokens) / len(union) if union else 0.0
+    if similarity < SEMANTIC_CACHE_THRESHOLD:
+        return None
+
+    print(f"Reusing recommendations from a similar earlier prompt (similarity {similarity:.2f}).")
+    return entry.get('response')
+
+def save_similar_response(prompt, media_type, collection_name, scope, max_tokens, response_data):
+    """Remember the latest prompt and response of a partition for near-duplicate lookups."""
+    cache_file = _semantic_cache_file(media_type, collection_name, scope, max_tokens)
+    entry = {
+        'collection_name': collection_name,
+        'media_type': media_type,
+        'timestamp': time.time(),
+        'tokens': sorted(_prompt_tokens(prompt)),
+        'response': response_data
+    }
+    try:
+        os.makedirs(SEMANTIC_CACHE_DIR, exist_ok=True)
+        tmp_file = f"{cache_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print(f"Could not write similar-prompt cache: {e}")
+
+def recommendation_token_budget(count):
+    """Return the max_tokens budget for a response with the given number of recommendations."""
+    return count * TOKENS_PER_RECOMMENDATION + RESPONSE_TOKEN_HEADROOM
+
+def build_request_data(prompt, max_tokens=1400):
+    """Build the chat completion request body for a recommendation prompt."""
+    return dict(
+        REQUEST_TEMPLATE,
+        messages=[SYSTEM_PROMPT_MESSAGE, {"role": "user", "content": prompt}],
+        max_tokens=max_tokens
+    )
+
+async def stream_content(response, stream_info):
+    """Yield the content deltas of a streamed chat completion (server-sent events).
 
-def get_recommendations(prompt, media_type):
-    """Get recommendations from GPT-4o mini API."""
-    config, _ = read_config()
-    API_KEY = config.get('GPT', 'GPT4O_API_KEY')
+    The finish reason of the completion is recorded in stream_info['finish_reason'].
+    """
+    async for raw_line in response.content:
+        line = raw_line.decode('utf-8').strip()
+        if not line.startswith('data: '):
+            continue
+        payload = line[len('data: '):]
+        if payload == '[DONE]':
+            break
+        choices = orjson.loads(payload).get('choices')
+        if choices:
+            if choices[0].get('finish_reason'):
+                stream_info['finish_reason'] = choices[0]['finish_reason']
+            content = choices[0].get('delta', {}).get('content')
+            if content:
+                yield content
+
+async def iter_stream_items(chunks):
+    """Yield each object of the streamed JSON array as soon as it is complete."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = None
+    async for chunk in chunks:
+        buffer += chunk
+        if pos is None:
+            array_start = buffer.find('[')
+            if array_start == -1:
+                continue
+            pos = array_start + 1
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(buffer) or buffer[pos] == ']':
+                break
+            try:
+                item, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The next item isn't complete yet, wait for more content
+                break
+            yield item
 
-    if not API_KEY:
-        raise Exception("GPT4O_API_KEY not found in configuration file.")
+async def get_recommendations(session, prompt, media_type, collection_name, api_key, cache_ttl_hours=24, max_tokens=1400, similar_scope=None):
+    """Get recommendations from GPT-4o mini API, reusing cached responses within the TTL.
 
-    url = 'https://api.openai.com/v1/chat/completions'
+    Prompts built around the watch history pass their task text as similar_scope, so a near-identical
+    history can reuse an earlier response. Without a scope only exact matches are served from the cache.
+    """
+    url = f'{OPENAI_API_URL}/chat/completions'
 
     headers = {
-        'Authorization': f'Bearer {API_KEY}',
+        'Authorization': f'Bearer {api_key}',
         'Content-Type': 'application/json',
     }
 
-    data = {
-        'model': 'gpt-4o-mini',
-        'messages': [
-            {"role": "system", "content": f"You are a recommendation system for {media_type}s."},
-            {"role": "user", "content": prompt}
-        ],
-        'max_tokens': 10000,
-        'temperature': 0.7,
-        'n': 1,
+    data = build_request_data(prompt, max_tokens)
+
+    key = _cache_key(data)
+    cached = load_cached_response(key, cache_ttl_hours)
+    if cached is not None:
+        print(f"Using cached recommendations for {collection_name}.")
+        return cached
+
+    if similar_scope is not None:
+        similar = load_similar_response(prompt, media_type, collection_name, similar_scope, max_tokens, cache_ttl_hours)
+        if similar is not None:
+            return similar
+
+    # Stream the completion so recommendations are parsed as they are generated; the cache key
+    # above is computed without the stream flag so cached entries stay valid either way
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            async with session.post(url, headers=headers, json=dict(data, stream=True)) as response:
+                if response.status in RETRY_STATUSES and attempt < MAX_RETRIES:
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+                    continue
+
+                if response.status != 200:
+                    raise Exception(f"API request failed with status {response.status}: {await response.text()}")
+
+                recommendations = []
+                stream_info = {}
+                async for recommendation in iter_stream_items(stream_content(response, stream_info)):
+                    recommendations.append(recommendation)
+                break
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            # Connection resets and timeouts are retried like the retryable statuses above
+            if attempt >= MAX_RETRIES:
+                raise
+            await asyncio.sleep(0.5 * 2 ** attempt)
+
+    # Rebuild a regular chat completion from the complete items, so a cut-off stream still
+    # yields every recommendation received before the cut
+    response_data = {
+        'choices': [{
+            'message': {'role': 'assistant', 'content': json.dumps({'recommendations': recommendations})}
+        }]
     }
+    # A completion cut off at max_tokens is used for this run but never cached
+    if recommendations and stream_info.get('finish_reason') == 'stop':
+        save_cached_response(key, response_data)
+        if similar_scope is not None:
+            save_similar_response(prompt, media_type, collection_name, similar_scope, max_tokens, response_data)
+    return response_data
+
+def load_state():
+    """Load the persisted run state, or an empty state if there is none."""
+    try:
+        with open(STATE_FILE) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+def save_state(state):
+    """Atomically persist the run state."""
+    tmp_file = f"{STATE_FILE}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_file, STATE_FILE)
+
+def submit_batch(jobs, api_key):
+    """Submit recommendation jobs to the OpenAI Batch API and return the batch id."""
+    headers = {'Authorization': f'Bearer {api_key}'}
+
+    lines = [
+        json.dumps({
+            'custom_id': collection_name,
+            'method': 'POST',
+            'url': '/v1/chat/completions',
+            'body': build_request_data(prompt, max_tokens)
+        })
+        for _, collection_name, prompt, _, max_tokens, _, _ in jobs
+    ]
+    batch_input = '\n'.join(lines).encode()
 
-    response = requests.post(url, headers=headers, json=data)
+    response = SESSION.post(
+        f'{OPENAI_API_URL}/files',
+        headers=headers,
+        data={'purpose': 'batch'},
+        files={'file': ('batch_input.jsonl', batch_input)}
+    )
+    if response.status_code != 200:
+        raise Exception(f"Batch file upload failed with status {response.status_code}: {response.text}")
+    input_file_id = response.json()['id']
+
+    response = SESSION.post(
+        f'{OPENAI_API_URL}/batches',
+        headers=headers,
+        json={
+            'input_file_id': input_file_id,
+            'endpoint': '/v1/chat/completions',
+            'completion_window': '24h'
+        }
+    )
+    if response.status_code != 200:
+        raise Exception(f"Batch creation failed with status {response.status_code}: {response.text}")
+    return response.json()['id']
+
+def fetch_batch_results(batch_id, api_key):
+    """Return {custom_id: chat completion} for a finished batch, or None while it is still running."""
+    headers = {'Authorization': f'Bearer {api_key}'}
+
+    response = SESSION.get(f'{OPENAI_API_URL}/batches/{batch_id}', headers=headers)
+    if response.status_code != 200:
+        raise Exception(f"Batch status request failed with status {response.status_code}: {response.text}")
+    batch = response.json()
 
+    if batch['status'] in ('failed', 'expired', 'cancelled'):
+        print(f"Batch {batch_id} ended with status '{batch['status']}'.")
+        return {}
+    if batch['status'] != 'completed':
+        return None
+    if not batch.get('output_file_id'):
+        return {}
+
+    response = SESSION.get(f"{OPENAI_API_URL}/files/{batch['output_file_id']}/content", headers=headers)
     if response.status_code != 200:
-        raise Exception(f"API request failed with status {response.status_code}: {response.text}")
+        raise Exception(f"Batch result download failed with status {response.status_code}: {response.text}")
 
-    return response.json()
+    results = {}
+    for line in response.text.splitlines():
+        if not line.strip():
+            continue
+        result = orjson.loads(line)
+        result_response = result.get('response') or {}
+        if result_response.get('status_code') == 200:
+            results[result['custom_id']] = result_response['body']
+        else:
+            print(f"Batch request for {result['custom_id']} failed: {result.get('error')}")
+    return results
 
 def parse_recommendations(response_text):
     """Parse the API response and extract recommendations."""
     try:
-        recommendations = json.loads(response_text)
-        return recommendations
-    except json.JSONDecodeError:
-        json_start = response_text.find('[')
-        json_end = response_text.rfind(']')
-        if json_start != -1 and json_end != -1:
-            try:
-                recommendations = json.loads(response_text[json_start:json_end+1])
-                return recommendations
-            except json.JSONDecodeError:
-                pass
+        recommendations = orjson.loads(response_text)['recommendations']
+    except (orjson.JSONDecodeError, TypeError, KeyError):
         raise Exception("Failed to parse the response as JSON.")
+    if not isinstance(recommendations, list):
+        raise Exception("The response does not contain a list of recommendations.")
+    return recommendations
+
+def is_complete_response(response):
+    """Return True if a chat completion finished normally and holds a parseable list of recommendations."""
+    try:
+        choice = response['choices'][0]
+        if choice.get('finish_reason') != 'stop':
+            return False
+        parse_recommendations(choice['message']['content'])
+    except Exception:
+        return False
+    return True
 
 def get_current_season():
     """Determine the current season based on the current month."""
@@ -141,33 +516,29 @@ def get_upcoming_holiday():
     else:
         return None
 
-def create_collection_with_recommendations(plex, recommendations_df, media_type, collection_name):
-    """Create or update a Plex collection with recommended items and feature it on the home screen."""
+def create_collection_with_recommendations(section, title_index, recommendations, collection_name, pending_labels):
+    """Create or update a Plex collection with recommended items and feature it on the home screen.
+
+    Labels for the matched items are recorded in pending_labels (rating key -> (item, labels))
+    and written later by apply_labels.
+    """
+    from plexapi.exceptions import NotFound, BadRequest
+
     plex_items = []
     missing_titles = []
 
-    section = plex.library.section('Movies' if media_type == 'Movie' else 'TV Shows')
-
-    for _, row in recommendations_df.iterrows():
-        title = row['title']
-        try:
-            results = section.search(title)
-            found = False
-            for result in results:
-                if result.title.lower() == title.lower():
-                    plex_items.append(result)
-                    found = True
-                    print(f"Found in Plex: {title}")
-                    result.addLabel(f"AI Recommended - {collection_name}")
-                    print(f"Added 'AI Recommended - {collection_name}' tag to: {title}")
-                    break
-            if not found:
-                missing_titles.append(title)
-                print(f"Not found in Plex: {title}")
-        except NotFound:
+    for rec in recommendations:
+        title = rec['title']
+        result = title_index.get(title.lower())
+        if result is not None:
+            plex_items.append(result)
+            print(f"Found in Plex: {title}")
+        else:
             missing_titles.append(title)
             print(f"Not found in Plex: {title}")
-            continue
+
+    for item in plex_items:
+        pending_labels.setdefault(item.ratingKey, (item, []))[1].append(f"AI Recommended - {collection_name}")
 
     if plex_items:
         try:
@@ -186,9 +557,10 @@ def create_collection_with_recommendations(plex, recommendations_df, media_type,
 
         # Update collection summary with reasons
         summary = "Recommendations based on your watch history, favorites, and ratings:\n\n"
-        for _, row in recommendations_df.iterrows():
-            if row['title'] in [item.title for item in plex_items]:
-                summary += f"- {row['title']}: {row['reason']}\n"
+        found_titles = {item.title for item in plex_items}
+        for rec in recommendations:
+            if rec['title'] in found_titles:
+                summary += f"- {rec['title']}: {rec['reason']}\n"
         collection.editSummary(summary)
 
         # Feature the collection on the home screen
@@ -209,10 +581,10 @@ def create_collection_with_recommendations(plex, recommendations_df, media_type,
 
     return missing_titles
 
-def add_to_ombi(missing_titles, collection_name, config):
-    """Add missing titles to Ombi for requesting."""
-    OMBI_URL = config.get('OMBI', 'OMBI_URL')
-    OMBI_API_KEY = config.get('OMBI', 'OMBI_API_KEY')
+async def add_to_ombi_async(missing_titles, collection_name, settings):
+    """Add missing titles to Ombi for requesting, processing titles concurrently."""
+    OMBI_URL = settings.ombi_url
+    OMBI_API_KEY = settings.ombi_api_key
 
     print(f"Adding missing titles from {collection_name} to Ombi:")
 
@@ -223,52 +595,74 @@ def add_to_ombi(missing_titles, collection_name, config):
     }
 
     timeout = 30
+    media_type = 'movie' if 'movie' in collection_name.lower() else 'tv'
 
-    for title in missing_titles:
+    async def fetch_requested_titles(session):
+        """Fetch everything already requested in Ombi once, keyed by lowercase title."""
         try:
-            if 'movie' in collection_name.lower():
-                search_url = f"{OMBI_URL}/api/v1/Search/movie/{title}"
-            else:
-                search_url = f"{OMBI_URL}/api/v1/Search/tv/{title}"
-
-            search_response = requests.get(search_url, headers=headers, timeout=timeout)
-
-            if search_response.status_code == 200:
-                search_results = search_response.json()
-                if search_results:
-                    media_result = search_results[0]
-                    media_type = 'movie' if 'movie' in collection_name.lower() else 'tv'
-
-                    if media_type == 'movie':
-                        request_url = f"{OMBI_URL}/api/v1/Request/movie"
-                        request_data = {
-                            'theMovieDbId': media_result['theMovieDbId'],
-                            'languageCode': 'en'
-                        }
-                    else:
-                        request_url = f"{OMBI_URL}/api/v1/Request/tv"
-                        request_data = {
-                            'tvDbId': media_result['theTvDbId'],
-                            'requestAll': True,
-                            'languageCode': 'en'
-                        }
+            async with session.get(f"{OMBI_URL}/api/v1/Request/{media_type}") as response:
+                if response.status != 200:
+                    print(f"  - Failed to fetch existing Ombi requests. Status code: {response.status}")
+                    return {}
+                existing_requests = orjson.loads(await response.read())
+        except (asyncio.TimeoutError, aiohttp.ClientError, orjson.JSONDecodeError) as e:
+            print(f"  - Failed to fetch existing Ombi requests. Error: {str(e)}")
+            return {}
+        return {request['title'].lower(): request for request in existing_requests if request.get('title')}
+
+    async def process_title(sem, session, title):
+        async with sem:
+            try:
+                search_url = f"{OMBI_URL}/api/v1/Search/{media_type}/{title}"
 
-                    request_response = requests.post(request_url, headers=headers, json=request_data, timeout=timeout)
+                async with session.get(search_url) as search_response:
+                    if search_response.status != 200:
+                        print(f"  - Failed to search in Ombi: {title}. Status code: {search_response.status}")
+                        return
+                    search_results = await search_response.json()
 
-                    if request_response.status_code == 200:
+                if not search_results:
+                    print(f"  - Could not find in Ombi database: {title}")
+                    return
+
+                media_result = search_results[0]
+                if media_type == 'movie':
+                    request_url = f"{OMBI_URL}/api/v1/Request/movie"
+                    request_data = {
+                        'theMovieDbId': media_result['theMovieDbId'],
+                        'languageCode': 'en'
+                    }
+                else:
+                    request_url = f"{OMBI_URL}/api/v1/Request/tv"
+                    request_data = {
+                        'tvDbId': media_result['theTvDbId'],
+                        'requestAll': True,
+                        'languageCode': 'en'
+                    }
+
+                async with session.post(request_url, json=request_data) as request_response:
+                    if request_response.status == 200:
                         print(f"  - Successfully added to Ombi: {title}")
                     else:
-                        print(f"  - Failed to add to Ombi: {title}. Status code: {request_response.status_code}")
-                else:
-                    print(f"  - Could not find in Ombi database: {title}")
+                        print(f"  - Failed to add to Ombi: {title}. Status code: {request_response.status}")
+            except asyncio.TimeoutError:
+                print(f"  - Timeout occurred while processing: {title}. The request took longer than {timeout} seconds to complete.")
+            except aiohttp.ClientError as e:
+                print(f"  - An error occurred while processing: {title}. Error: {str(e)}")
+            finally:
+                await asyncio.sleep(0.2)  # Add a small delay before the slot is released
+
+    # Cap the number of in-flight requests so Ombi isn't hammered
+    sem = asyncio.Semaphore(5)
+    async with aiohttp.ClientSession(headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        requested_titles = await fetch_requested_titles(session)
+        titles_to_request = []
+        for title in missing_titles:
+            if title.lower() in requested_titles:
+                print(f"  - Already requested in Ombi: {title}")
             else:
-                print(f"  - Failed to search in Ombi: {title}. Status code: {search_response.status_code}")
-        except Timeout:
-            print(f"  - Timeout occurred while processing: {title}. The request took longer than {timeout} seconds to complete.")
-        except RequestException as e:
-            print(f"  - An error occurred while processing: {title}. Error: {str(e)}")
-
-        time.sleep(1)  # Add a small delay between requests
+                titles_to_request.append(title)
+        await asyncio.gather(*(process_title(sem, session, title) for title in titles_to_request))
 
     print(f"Finished processing Ombi additions for {collection_name}.")
 
@@ -281,7 +675,7 @@ def request_device_code(client_id):
         'client_id': client_id
     }
 
-    response = requests.post(url, headers=headers, json=payload)
+    response = SESSION.post(url, headers=headers, json=payload)
 
     if response.status_code == 200:
         return response.json()  # Contains device_code, user_code, verification_url, expires_in, interval
@@ -299,7 +693,7 @@ def poll_for_access_token(device_code, client_id, client_secret, interval):
     }
 
     while True:
-        response = requests.post(url, headers=headers, json=payload)
+        response = SESSION.post(url, headers=headers, json=payload)
 
         if response.status_code == 200:
             return response.json()  # Contains access_token, refresh_token, expires_in
@@ -345,7 +739,7 @@ def get_trakt_access_token(config, config_file):
             'client_secret': client_secret,
             'grant_type': 'refresh_token'
         }
-        response = requests.post(token_url, json=data)
+        response = SESSION.post(token_url, json=data)
 
         if response.status_code == 200:
             token_data = response.json()
@@ -411,188 +805,338 @@ def check_trakt_credentials(config, config_file):
         print(f"Error in Trakt configuration: {e}")
         return False
 
-def add_to_trakt(missing_titles, collection_name, config):
-    """Add missing titles to a Trakt collection."""
+def add_to_trakt(missing_titles, collection_name, settings):
+    """Add missing titles to a Trakt collection with a single sync request."""
     trakt_url = "https://api.trakt.tv/sync/collection"
-    access_token = config.get('TRAKT', 'ACCESS_TOKEN')
+    access_token = settings.trakt_access_token
 
     headers = {
         'Authorization': f'Bearer {access_token}',
         'Content-Type': 'application/json',
         'trakt-api-version': '2',
-        'trakt-api-key': config.get('TRAKT', 'CLIENT_ID')
+        'trakt-api-key': settings.trakt_client_id
     }
 
     print(f"Adding missing titles from {collection_name} to Trakt:")
 
-    for title in missing_titles:
-        # Construct data for each movie or show
-        media_data = {
-            "movies": [{"title": title}] if 'movie' in collection_name.lower() else None,
-            "shows": [{"title": title}] if 'tv' in collection_name.lower() else None
-        }
+    if not missing_titles:
+        print(f"Finished processing Trakt additions for {collection_name}.")
+        return
 
-        # Remove empty entries
-        media_data = {k: v for k, v in media_data.items() if v is not None}
+    # /sync/collection accepts arrays, so all titles go into one request
+    entries = [{"title": title} for title in missing_titles]
+    media_data = {
+        "movies": entries if 'movie' in collection_name.lower() else None,
+        "shows": entries if 'tv' in collection_name.lower() else None
+    }
 
-        try:
-            response = requests.post(trakt_url, headers=headers, json=media_data)
-            if response.status_code == 201:
-                print(f"  - Successfully added to Trakt: {title}")
-            else:
-                print(f"  - Failed to add to Trakt: {title}. Status code: {response.status_code}")
-        except RequestException as e:
-            print(f"  - An error occurred while processing: {title}. Error: {str(e)}")
+    # Remove empty entries
+    media_data = {k: v for k, v in media_data.items() if v is not None}
 
-        time.sleep(1)  # Add a small delay between requests
+    try:
+        response = SESSION.post(trakt_url, headers=headers, json=media_data)
+        if response.status_code == 201:
+            not_found = response.json().get('not_found', {})
+            not_found_titles = {
+                entry.get('title') for media_type in ('movies', 'shows') for entry in not_found.get(media_type, [])
+            }
+            for title in missing_titles:
+                if title in not_found_titles:
+                    print(f"  - Could not find on Trakt: {title}")
+                else:
+                    print(f"  - Successfully added to Trakt: {title}")
+        else:
+            print(f"  - Failed to add titles to Trakt. Status code: {response.status_code}")
+    except RequestException as e:
+        print(f"  - An error occurred while adding titles to Trakt. Error: {str(e)}")
 
     print(f"Finished processing Trakt additions for {collection_name}.")
 
+def apply_labels(pending_labels):
+    """Write all collected labels, with one edit request per item."""
+    def add_labels(entry):
+        item, labels = entry
+        # An item recommended twice for the same collection only needs its label once
+        labels = list(dict.fromkeys(labels))
+        try:
+            # addLabel accepts a list and sends all labels in a single request
+            item.addLabel(labels)
+            print(f"Added {', '.join(repr(label) for label in labels)} tag(s) to: {item.title}")
+        except Exception as e:
+            print(f"Error adding tags to {item.title}: {e}")
+
+    # Label updates for different items are independent requests, so send them in parallel
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(add_labels, pending_labels.values()))
+
+def process_recommendations(library, pending_labels, response, media_type, collection_name, output_file, settings):
+    """Turn an API response into a Plex collection, Ombi/Trakt requests and a CSV file. Returns True if the collection was updated."""
+    try:
+        recommendations_text = response['choices'][0]['message']['content'].strip()
+        recommendations = parse_recommendations(recommendations_text)
+        valid_recommendations = [
+            rec for rec in recommendations
+            if isinstance(rec, dict) and all(key in rec for key in ('title', 'genre', 'description', 'reason'))
+        ]
+        if not valid_recommendations:
+            print(f"No valid recommendations were found for {collection_name} collection.")
+            return False
+
+        section, title_index = library[media_type]
+        missing_titles = create_collection_with_recommendations(section, title_index, valid_recommendations, collection_name, pending_labels)
+        if settings.ombi_enabled:
+            asyncio.run(add_to_ombi_async(missing_titles, collection_name, settings))
+        if settings.trakt_enabled:
+            add_to_trakt(missing_titles, collection_name, settings)
+
+        with open(output_file, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['title', 'genre', 'description', 'reason'], extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(valid_recommendations)
+        print(f"\n{collection_name} recommendations saved to '{output_file}'.")
+        return True
+    except Exception as e:
+        print(f"An error occurred while processing {collection_name} recommendations: {e}")
+        return False
+
+def apply_batch_results(library, pending_labels, settings):
+    """Apply the results of the pending batch if it has finished. Returns the updated collection names."""
+    state = load_state()
+    pending = state.get('batch')
+    updated_collections = []
+    if not pending:
+        return updated_collections
+
+    try:
+        results = fetch_batch_results(pending['id'], settings.gpt_api_key)
+        if results is None:
+            print(f"Batch {pending['id']} is still in progress. Its collections will be updated on a later run.")
+            return updated_collections
+
+        for media_type, collection_name, output_file, cache_key in pending['jobs']:
+            if collection_name in results:
+                # Cut-off or unparseable bodies are still processed below but never cached
+                if is_complete_response(results[collection_name]):
+                    save_cached_response(cache_key, results[collection_name])
+                if process_recommendations(library, pending_labels, results[collection_name], media_type, collection_name, output_file, settings):
+                    updated_collections.append(collection_name)
+        state.pop('batch')
+        save_state(state)
+    except Exception as e:
+        print(f"An error occurred while processing the recommendation batch: {e}")
+
+    return updated_collections
+
+def submit_batch_collections(batch_jobs, applied_collections, settings):
+    """Submit the uncached collections as a new batch. Returns the jobs that can be served from the response cache instead."""
+    state = load_state()
+    pending = state.get('batch')
+    cached_jobs = []
+
+    # Collections still waiting in a batch or just applied from one are left alone; the rest are
+    # served from the response cache when possible and only the remainder is billed as a new batch
+    skipped = set(applied_collections)
+    if pending:
+        skipped.update(collection_name for _, collection_name, _, _ in pending['jobs'])
+
+    new_batch_jobs = []
+    for job in batch_jobs:
+        _, collection_name, prompt, cache_ttl_hours, max_tokens, _, _ = job
+        if collection_name in skipped:
+            continue
+        if load_cached_response(_cache_key(build_request_data(prompt, max_tokens)), cache_ttl_hours) is not None:
+            cached_jobs.append(job)
+        else:
+            new_batch_jobs.append(job)
+
+    # Only one batch is kept in flight at a time
+    if new_batch_jobs and not pending:
+        try:
+            batch_id = submit_batch(new_batch_jobs, settings.gpt_api_key)
+            state['batch'] = {
+                'id': batch_id,
+                'jobs': [
+                    [media_type, collection_name, output_file, _cache_key(build_request_data(prompt, max_tokens))]
+                    for media_type, collection_name, prompt, _, max_tokens, output_file, _ in new_batch_jobs
+                ]
+            }
+            save_state(state)
+            print(f"Submitted batch {batch_id} with {len(new_batch_jobs)} collections.")
+        except Exception as e:
+            print(f"An error occurred while submitting the recommendation batch: {e}")
+
+    return cached_jobs
+
+async def run_recommendation_jobs(jobs, library, pending_labels, settings):
+    """Request recommendations concurrently and apply each result as soon as it arrives.
+
+    Plex, Ombi and Trakt updates run in worker threads, one collection at a time, while the
+    remaining OpenAI requests are still in flight. Returns the updated collection names in job order.
+    """
+    # PlexAPI isn't guaranteed to be thread-safe for writes, so collections are applied one at a time
+    plex_lock = threading.Lock()
+
+    def apply_response(response, media_type, collection_name, output_file):
+        with plex_lock:
+            return process_recommendations(library, pending_labels, response, media_type, collection_name, output_file, settings)
+
+    async def run_job(session, job):
+        media_type, collection_name, prompt, cache_ttl_hours, max_tokens, output_file, similar_scope = job
+        try:
+            response = await get_recommendations(session, prompt, media_type, collection_name, settings.gpt_api_key, cache_ttl_hours, max_tokens, similar_scope)
+        except Exception as e:
+            print(f"An error occurred while processing {collection_name} recommendations: {e}")
+            return None
+        updated = await asyncio.to_thread(apply_response, response, media_type, collection_name, output_file)
+        return collection_name if updated else None
+
+    connector = aiohttp.TCPConnector(limit=10)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        results = await asyncio.gather(*(run_job(session, job) for job in jobs))
+    return [collection_name for collection_name in results if collection_name]
+
 def main():
     start_time = time.time()
 
     config, config_file = read_config()
-    PLEX_URL = config.get('PLEX', 'PLEX_URL')
-    PLEX_TOKEN = config.get('PLEX', 'PLEX_TOKEN')
-    NUMBER_OF_RECOMMENDATIONS = config.getint('RECOMMENDATIONS', 'NUMBER_OF_RECOMMENDATIONS', fallback=10)
+    settings = load_settings(config)
 
-    if not PLEX_URL or not PLEX_TOKEN:
+    if not settings.plex_url or not settings.plex_token:
         print("Error: PLEX_URL and/or PLEX_TOKEN not found in configuration file.")
         return
 
-    ombi_enabled = check_ombi_credentials(config)
-    if ombi_enabled:
+    if not settings.gpt_api_key:
+        print("Error: GPT4O_API_KEY not found in configuration file.")
+        return
+
+    if settings.ombi_enabled:
         print("Ombi credentials found. Ombi integration will be used.")
     else:
         print("Ombi credentials not found or incomplete. Ombi integration will be skipped.")
 
-    trakt_enabled = check_trakt_credentials(config, config_file)  # Pass config_file here
-    if trakt_enabled:
+    if check_trakt_credentials(config, config_file):
+        # The token may just have been refreshed and written back to the config
+        settings = replace(settings, trakt_access_token=config.get('TRAKT', 'ACCESS_TOKEN'))
         print("Trakt credentials found. Trakt integration will be used.")
     else:
         print("Trakt credentials not found or incomplete. Trakt integration will be skipped.")
 
+    # Imported here so runs that exit early don't pay for loading plexapi
+    from plexapi.server import PlexServer
+
     try:
-        plex = PlexServer(PLEX_URL, PLEX_TOKEN)
+        plex = PlexServer(settings.plex_url, settings.plex_token)
     except Exception as e:
         print(f"An error occurred while connecting to Plex: {e}")
         return
 
-    watched_titles = get_watched_titles(plex)
-    ratings = get_user_preferences(plex)
+    # Fetch each library section once and reuse the items for everything below
+    movies_section = plex.library.section('Movies')
+    movies_all = movies_section.all()
+    tv_section = plex.library.section('TV Shows')
+    tv_all = tv_section.all()
+
+    # Section and title index per media type; kept apart so a movie never lands in a TV collection with the same title
+    library = {
+        'Movie': (movies_section, build_title_index(movies_all)),
+        'TV Show': (tv_section, build_title_index(tv_all))
+    }
+
+    watched_titles, ratings = scan_library(movies_all, tv_all)
 
     if not watched_titles and not ratings:
         print("No watched titles or ratings found in your Plex library.")
         return
 
     updated_collections = []
+    # Labels are collected across all collections and written once per item at the end
+    pending_labels = {}
+
+    # The themed prompts don't depend on the library, so a finished batch is applied on every run,
+    # even when the rest of the run is skipped below
+    if settings.use_batch_api:
+        updated_collections.extend(apply_batch_results(library, pending_labels, settings))
+
+    # Skip the rest of the run if the library hasn't changed since recent collections were generated
+    library_digest = hashlib.sha256(
+        '\n'.join(sorted(watched_titles) + sorted(f"{title}={rating}" for title, rating in ratings.items())).encode()
+    ).hexdigest()
+    previous_run = load_state().get('library', {})
+    if (previous_run.get('digest') == library_digest
+            and time.time() - previous_run.get('timestamp', 0) < settings.skip_unchanged_days * 86400):
+        print("Library unchanged since the last run, skipping recommendations.")
+        if updated_collections:
+            apply_labels(pending_labels)
+            print("\nUpdated collections from the finished batch:")
+            for collection in updated_collections:
+                print(f"- {collection}")
+        return
+
+    # Each job is (media type, collection name, prompt, cache TTL in hours, max tokens, output file,
+    # similar-prompt cache scope or None for exact-match caching only)
+    jobs = []
+
+    # Only the most recently watched titles go into the prompt to keep it short on large libraries;
+    # the same string is shared by both prompts
+    watched_summary = ', '.join(watched_titles[:settings.max_prompt_titles])
+    older_titles = len(watched_titles) - settings.max_prompt_titles
+    if older_titles > 0:
+        watched_summary += f" (plus {older_titles} older titles)"
+
+    ratings_summary = ', '.join(f"{title} ({rating})" for title, rating in ratings.items())
+
+    # The large watch history block goes first and is identical for both prompts;
+    # only the task at the end differs
+    preamble = (
+        "I have watched the following movies and TV shows, most recent first:\n\n"
+        f"{watched_summary}\n\n"
+        "I have rated the following titles (out of 10):\n"
+        f"{ratings_summary}\n\n"
+        f"{RESPONSE_FORMAT_INSTRUCTIONS}\n"
+    )
 
     # Standard recommendations for Movies and TV Shows
     for media_type in ['Movie', 'TV Show']:
-        prompt = f"""
-        I have watched the following movies and TV shows:
-
-        {', '.join(watched_titles)}
-
-        I have rated the following titles (out of 10):
-        {', '.join([f"{title} ({rating})" for title, rating in ratings.items()])}
-
-        Based on this information, recommend {NUMBER_OF_RECOMMENDATIONS} new {media_type.lower()}s that I might like. For each recommendation, provide the following in JSON format:
-
-        {{
-          "title": "Title of the {media_type.lower()}",
-          "genre": "Genre(s)",
-          "description": "A brief description",
-          "reason": "A brief explanation of why this is recommended based on my watch history and ratings"
-        }}
-
-        Please provide the entire response as a JSON array of objects.
-        """
-
-        try:
-            print(f"Requesting {media_type} recommendations from the GPT-4o mini API...")
-            response = get_recommendations(prompt, media_type)
-            recommendations_text = response['choices'][0]['message']['content'].strip()
-            recommendations = parse_recommendations(recommendations_text)
-            valid_recommendations = [
-                rec for rec in recommendations
-                if isinstance(rec, dict) and all(key in rec for key in ('title', 'genre', 'description', 'reason'))
-            ]
-            if valid_recommendations:
-                recommendations_df = pd.DataFrame(valid_recommendations)
-                collection_name = f'AI Recommended {media_type}s'
-                missing_titles = create_collection_with_recommendations(plex, recommendations_df, media_type, collection_name)
-                if ombi_enabled:
-                    add_to_ombi(missing_titles, collection_name, config)
-                if trakt_enabled:
-                    add_to_trakt(missing_titles, collection_name, config)
-
-                output_file = f'/output/{media_type.lower()}_recommendations.csv'
-                recommendations_df.to_csv(output_file, index=False)
-                print(f"\n{media_type} recommendations saved to '{output_file}'.")
-                updated_collections.append(collection_name)
-            else:
-                print(f"No valid {media_type.lower()} recommendations were found.")
-        except Exception as e:
-            print(f"An error occurred while processing {media_type.lower()} recommendations: {e}")
-
-    # Additional collections for Movies
-    additional_collections = [
-        ("Seasonal", f"Recommend 10 movies suitable for {get_current_season()} season."),
-        ("Holiday", f"Recommend 10 movies suitable for {get_upcoming_holiday() or 'the upcoming holiday season'}."),
-        ("Romantic Comedy", "Recommend 10 top romantic comedy movies."),
-        ("Action Adventure", "Recommend 10 exciting action-adventure movies."),
-        ("Family Friendly", "Recommend 10 family-friendly movies suitable for all ages."),
-        ("Sci-Fi Spectacle", "Recommend 10 mind-bending science fiction movies."),
-        ("Classic Cinema", "Recommend 10 classic movies from various decades that have stood the test of time."),
-        ("Based on True Story", "Recommend 10 compelling movies based on true stories or real events."),
-        ("90s & 00s Teenage Movies", "Recommend 10 iconic teenage movies from the 1990s and 2000s."),
-        ("Very Sarcastic Movies", "Recommend 10 highly sarcastic or satirical movies, similar in tone to 'Baby Mama (2008)' or 'They Came Together (2014)'.")
-    ]
-
-    for collection_name, recommendation_prompt in additional_collections:
-        prompt = f"""
-        Based on the following criteria:
-
-        {recommendation_prompt}
-
-        For each recommendation, provide the following in JSON format:
+        task = STANDARD_TASK_TEMPLATE.format(
+            count=settings.number_of_recommendations,
+            media_type_lower=media_type.lower()
+        )
+        prompt = preamble + task
+        output_file = f'/output/{media_type.lower()}_recommendations.csv'
+        max_tokens = recommendation_token_budget(settings.number_of_recommendations)
+        jobs.append((media_type, f'AI Recommended {media_type}s', prompt, 24, max_tokens, output_file, task))
+
+    # Additional collections for Movies; the date-dependent criteria are resolved once
+    season = get_current_season()
+    holiday = get_upcoming_holiday() or 'the upcoming holiday season'
+    # These prompts contain no watch history, so they are only served from the exact-match cache
+    additional_jobs = []
+    for collection_name, criteria, cache_ttl_hours in ADDITIONAL_COLLECTIONS:
+        prompt = COLLECTION_PROMPT_TEMPLATE.format(criteria=criteria.format(season=season, holiday=holiday))
+        output_file = f'/output/{collection_name.lower().replace(" ", "_")}_recommendations.csv'
+        # Every themed prompt asks for 10 movies
+        additional_jobs.append(("Movie", collection_name, prompt, cache_ttl_hours, recommendation_token_budget(10), output_file, None))
+
+    if settings.use_batch_api:
+        # The additional collections go through the Batch API: today's uncached collections are
+        # submitted for the next run, and the cached ones are applied directly
+        jobs.extend(submit_batch_collections(additional_jobs, updated_collections, settings))
+    else:
+        jobs.extend(additional_jobs)
 
-        {{
-          "title": "Title of the movie",
-          "genre": "Genre(s)",
-          "description": "A brief description",
-          "reason": "A brief explanation of why this movie fits the criteria"
-        }}
+    print(f"Requesting recommendations for {len(jobs)} collections from the GPT-4o mini API...")
+    updated_collections.extend(asyncio.run(run_recommendation_jobs(jobs, library, pending_labels, settings)))
 
-        Please provide the entire response as a JSON array of objects.
-        """
+    apply_labels(pending_labels)
 
-        try:
-            print(f"Requesting recommendations for {collection_name} collection...")
-            response = get_recommendations(prompt, "Movie")
-            recommendations_text = response['choices'][0]['message']['content'].strip()
-            recommendations = parse_recommendations(recommendations_text)
-            valid_recommendations = [
-                rec for rec in recommendations
-                if isinstance(rec, dict) and all(key in rec for key in ('title', 'genre', 'description', 'reason'))
-            ]
-            if valid_recommendations:
-                recommendations_df = pd.DataFrame(valid_recommendations)
-                missing_titles = create_collection_with_recommendations(plex, recommendations_df, "Movie", collection_name)
-                if trakt_enabled:
-                    add_to_trakt(missing_titles, collection_name, config)
-                if ombi_enabled:
-                    add_to_ombi(missing_titles, collection_name, config)
-
-                output_file = f'/output/{collection_name.lower().replace(" ", "_")}_recommendations.csv'
-                recommendations_df.to_csv(output_file, index=False)
-                print(f"\n{collection_name} recommendations saved to '{output_file}'.")
-                updated_collections.append(collection_name)
-            else:
-                print(f"No valid recommendations were found for {collection_name} collection.")
-        except Exception as e:
-            print(f"An error occurred while processing {collection_name} recommendations: {e}")
+    if updated_collections:
+        state = load_state()
+        state['library'] = {
+            'digest': library_digest,
+            'timestamp': time.time(),
+            'collections': updated_collections
+        }
+        save_state(state)
 
     print("\nUpdated collections:")
     for collection in updated_collections: